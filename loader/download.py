@@ -8,17 +8,170 @@ import json
 import pickle
 import tarfile
 import hashlib
+import mmap
 import asyncio
+import os
+import sqlite3
+import threading
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+# Largest network read handed to the hasher and file writer at once
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Major module versions this loader understands (1.x: one dict per chunk,
+# 2.x: columnar embeddings with out-of-band numeric buffers)
+SUPPORTED_MODULE_MAJORS = (1, 2)
+
+# Span covered by each chunk hash. The module hash is the SHA256 of the
+# concatenated chunk digests, so it must match the packager's chunk size
+MODULE_CHUNK_SIZE = 8 << 20
+
+# Sidecar written by the packager with per-chunk hashes of the .mkm file
+CHUNK_MANIFEST_SUFFIX = ".chunks.json"
+
+# Default location of the persistent module hash cache
+DEFAULT_HASH_CACHE_PATH = Path.home() / ".mkm" / "hashes.sqlite"
+
+def _root_hash(chunk_digests: List[bytes]) -> str:
+    """Module hash: SHA256 over the concatenated per-chunk SHA256 digests"""
+    return hashlib.sha256(b"".join(chunk_digests)).hexdigest()
+
+
+class ChunkHasher:
+    """Incremental module hash over data fed in arbitrary pieces"""
+    
+    def __init__(self):
+        self.chunk_digests = []
+        self._chunk_hash = hashlib.sha256()
+        self._chunk_filled = 0
+        
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        while view:
+            take = min(len(view), MODULE_CHUNK_SIZE - self._chunk_filled)
+            self._chunk_hash.update(view[:take])
+            self._chunk_filled += take
+            view = view[take:]
+            if self._chunk_filled == MODULE_CHUNK_SIZE:
+                self._finish_chunk()
+                
+    def _finish_chunk(self):
+        self.chunk_digests.append(self._chunk_hash.digest())
+        self._chunk_hash = hashlib.sha256()
+        self._chunk_filled = 0
+        
+    def hexdigest(self) -> str:
+        if self._chunk_filled:
+            self._finish_chunk()
+        return _root_hash(self.chunk_digests)
+
+
+def _cpu_has_sha_extensions() -> bool:
+    """Check /proc/cpuinfo for Intel SHA-NI or ARMv8 SHA2 instructions"""
+    try:
+        cpuinfo = Path("/proc/cpuinfo").read_text()
+    except OSError:
+        return False
+    for line in cpuinfo.splitlines():
+        if line.startswith(("flags", "Features")):
+            flags = line.split(":", 1)[-1].split()
+            if "sha_ni" in flags or "sha2" in flags:
+                return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def log_hash_backend():
+    """Log the hashing backend once per process"""
+    has_sha_ext = _cpu_has_sha_extensions()
+    print(f"🔧 Hash backend: {ssl.OPENSSL_VERSION}"
+          f"{' (CPU SHA extensions available)' if has_sha_ext else ''}")
+    print(f"   Algorithms: {', '.join(sorted(hashlib.algorithms_available))}")
+
+
+class HashCache:
+    """SQLite-backed cache of module hashes keyed by (path, size, mtime)"""
+    
+    def __init__(self, db_path: Path = DEFAULT_HASH_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self._conn = None
+        # Modules are verified in worker threads that share the connection
+        self._lock = threading.Lock()
+        
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database and create its schema on first use"""
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "path TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT, "
+                "PRIMARY KEY (path, size, mtime_ns))"
+            )
+            self._conn = conn
+        return self._conn
+        
+    def _key(self, file_path: Path) -> Tuple[str, int, int]:
+        stat = file_path.stat()
+        return str(file_path.resolve()), stat.st_size, stat.st_mtime_ns
+        
+    def get(self, file_path: Path) -> Optional[str]:
+        """Return the cached hash if the file is unchanged, else None"""
+        try:
+            key = self._key(file_path)
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT sha256 FROM hashes "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    key
+                ).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+        return row[0] if row else None
+        
+    def put(self, file_path: Path, sha256: str):
+        """Record the hash for the file's current size and mtime"""
+        try:
+            path, size, mtime_ns = self._key(file_path)
+            with self._lock, self._connection() as conn:
+                # Entries for older versions of the file can never match again
+                conn.execute("DELETE FROM hashes WHERE path = ?", (path,))
+                conn.execute(
+                    "INSERT INTO hashes (path, size, mtime_ns, sha256) "
+                    "VALUES (?, ?, ?, ?)",
+                    (path, size, mtime_ns, sha256)
+                )
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Could not update hash cache: {e}")
+            
+    def close(self):
+        """Close the database connection, if one was opened"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
 
 class MatrixKnowledgeLoader:
     """Downloads and installs Matrix Knowledge Modules"""
     
-    def __init__(self, vector_db_client=None, neo4j_client=None):
+    def __init__(self, vector_db_client=None, neo4j_client=None,
+                 max_concurrent_downloads: int = 8,
+                 hash_cache: Optional[HashCache] = None):
         self.vector_db = vector_db_client
         self.neo4j = neo4j_client
         self.installed_modules = {}
+        self.hash_cache = hash_cache if hash_cache is not None else HashCache()
+        log_hash_backend()
+        # Caps simultaneous network transfers when installing in bulk
+        self._download_semaphore = asyncio.Semaphore(max_concurrent_downloads)
         
     async def download_skill(self, skill_name: str, source_url: Optional[str] = None) -> bool:
         """
@@ -30,6 +183,7 @@ class MatrixKnowledgeLoader:
         
         # In production, this would query the blockchain registry
         # For now, we'll use a local file or provided URL
+        known_hash = None
         if not source_url:
             module_path = Path(f"{skill_name}.mkm")
             if not module_path.exists():
@@ -37,18 +191,24 @@ class MatrixKnowledgeLoader:
                 print("💡 In production, this would search the blockchain registry")
                 return False
         else:
-            # Download from URL (IPFS, S3, etc.)
-            module_path = await self._download_from_url(source_url, skill_name)
+            # Download from URL (IPFS gateway, S3, etc.)
+            try:
+                async with self._download_semaphore:
+                    module_path, known_hash = await self._download_from_url(
+                        source_url, skill_name)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                print(f"❌ Download error: {e!r}")
+                return False
             
         # Verify integrity
         print("🔐 Verifying module integrity...")
-        if not self._verify_module(module_path):
+        if not await asyncio.to_thread(self._verify_module, module_path, known_hash):
             print("❌ Module verification failed!")
             return False
             
         # Extract and install
         print("📥 Downloading knowledge...")
-        install_success = await self._install_module(module_path, skill_name)
+        install_success = await self._install_module(module_path)
         
         if install_success:
             print(f"✅ I know {skill_name}!")
@@ -61,43 +221,167 @@ class MatrixKnowledgeLoader:
             print(f"❌ Failed to install {skill_name}")
             return False
             
-    async def _download_from_url(self, url: str, skill_name: str) -> Path:
-        """Download module from remote source"""
-        # In production, this would handle IPFS, S3, HTTP downloads
-        # For now, placeholder
+    async def download_skills(
+        self,
+        skill_names: List[str],
+        source_urls: Optional[Dict[str, str]] = None
+    ) -> Dict[str, bool]:
+        """Download several skills concurrently, overlapping network and install"""
+        source_urls = source_urls or {}
+        # A repeated name would race two downloads onto the same files
+        async with asyncio.TaskGroup() as tg:
+            tasks = {
+                name: tg.create_task(
+                    self._download_skill_isolated(name, source_urls.get(name)))
+                for name in dict.fromkeys(skill_names)
+            }
+        return {name: task.result() for name, task in tasks.items()}
+        
+    async def _download_skill_isolated(self, skill_name: str,
+                                       source_url: Optional[str]) -> bool:
+        """download_skill that reports errors as False, so one failing module
+        doesn't cancel the rest of a download_skills batch"""
+        try:
+            return await self.download_skill(skill_name, source_url)
+        except Exception as e:
+            print(f"❌ Failed to install {skill_name}: {e!r}")
+            return False
+        
+    async def _download_from_url(self, url: str,
+                                 skill_name: str) -> Tuple[Path, str]:
+        """Download module over HTTP(S), hashing bytes as they arrive"""
         print(f"📡 Downloading from {url}...")
-        # Simulate download
-        await asyncio.sleep(1)
-        return Path(f"{skill_name}.mkm")
+        module_path = Path(f"{skill_name}.mkm")
+        # Stream into a side file so a failed transfer never clobbers a good module
+        part_path = module_path.with_suffix(".mkm.part")
+        hasher = ChunkHasher()
         
-    def _verify_module(self, module_path: Path) -> bool:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    chunks = response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE)
+                    f = await asyncio.to_thread(open, part_path, "wb")
+                    try:
+                        async for chunk in chunks:
+                            hasher.update(chunk)
+                            await asyncio.to_thread(f.write, chunk)
+                    finally:
+                        await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.replace, part_path, module_path)
+            # A sidecar left from an earlier copy would describe the wrong bytes
+            self._chunk_manifest_path(module_path).unlink(missing_ok=True)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+            
+        return module_path, hasher.hexdigest()
+        
+    def _verify_module(self, module_path: Path,
+                       known_hash: Optional[str] = None) -> bool:
         """Verify module integrity against blockchain hash"""
-        # Calculate actual hash
-        actual_hash = self._calculate_hash(module_path)
+        # Reuse the hash computed during download or cached from an earlier
+        # verification; only re-read the file when neither is available
+        actual_hash = known_hash
+        cached_hash = None
+        if actual_hash is None:
+            cached_hash = actual_hash = self.hash_cache.get(module_path)
+        if actual_hash is None:
+            chunk_digests = self._load_chunk_manifest(module_path)
+            if chunk_digests is None:
+                actual_hash = self._calculate_hash(module_path)
+            elif self._verify_chunks(module_path, chunk_digests):
+                # Derived from the digests just checked against the file,
+                # never taken from the sidecar itself
+                actual_hash = _root_hash(chunk_digests)
+            else:
+                print("❌ Module contents do not match its chunk hashes")
+                return False
+        if actual_hash != cached_hash:
+            self.hash_cache.put(module_path, actual_hash)
         
         # In production, check against blockchain
         # For now, always return True
         print(f"📝 Module hash: {actual_hash[:16]}...")
         return True
         
-    async def _install_module(self, module_path: Path, skill_name: str) -> bool:
-        """Extract and install module contents"""
+    def _chunk_manifest_path(self, module_path: Path) -> Path:
+        return module_path.with_name(module_path.name + CHUNK_MANIFEST_SUFFIX)
         
-        extract_dir = Path(f"temp_{skill_name}")
-        extract_dir.mkdir(exist_ok=True)
+    def _load_chunk_manifest(self, module_path: Path) -> Optional[List[bytes]]:
+        """Load the chunk digests from the packager's sidecar, if present and
+        well-formed"""
+        try:
+            with open(self._chunk_manifest_path(module_path), "r") as f:
+                chunk_manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+            
+        # A malformed sidecar is ignored so verification falls back to a full hash
+        if not isinstance(chunk_manifest, dict):
+            return None
+        chunk_hashes = chunk_manifest.get("chunk_hashes")
+        if (chunk_manifest.get("chunk_size") != MODULE_CHUNK_SIZE
+                or not isinstance(chunk_hashes, list)
+                or not all(isinstance(h, str) and len(h) == 64
+                           for h in chunk_hashes)):
+            return None
+        try:
+            chunk_digests = [bytes.fromhex(h) for h in chunk_hashes]
+        except ValueError:
+            return None
+        if chunk_manifest.get("root_hash") != _root_hash(chunk_digests):
+            return None
+        return chunk_digests
+            
+    def _verify_chunks(self, module_path: Path,
+                       expected: List[bytes]) -> bool:
+        """Hash fixed-size spans of the module in parallel against the sidecar,
+        stopping at the first mismatch"""
+        chunk_size = MODULE_CHUNK_SIZE
+        if -(-module_path.stat().st_size // chunk_size) != len(expected):
+            return False
+            
+        mismatch = threading.Event()
+        
+        def check_chunk(index: int) -> bool:
+            if mismatch.is_set():
+                return False
+            with open(module_path, "rb") as f:
+                f.seek(index * chunk_size)
+                data = f.read(chunk_size)
+            # hashlib releases the GIL while hashing large buffers
+            if hashlib.sha256(data).digest() != expected[index]:
+                mismatch.set()
+                return False
+            return True
+            
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for ok in executor.map(check_chunk, range(len(expected))):
+                if not ok:
+                    mismatch.set()
+                    break
+        return not mismatch.is_set()
+        
+    async def _install_module(self, module_path: Path) -> bool:
+        """Extract and install module contents"""
         
         try:
-            # Extract module
-            with tarfile.open(module_path, "r:gz") as tar:
-                tar.extractall(extract_dir)
-                
+            # Read module members straight from the archive, nothing hits disk.
+            # Runs in a worker thread so decompression doesn't block the loop
+            members = await asyncio.to_thread(self._read_members, module_path)
+            
             # Read manifest
-            with open(extract_dir / "manifest.json", "r") as f:
-                manifest = json.load(f)
-                
+            manifest = json.loads(members["manifest.json"])
+            
             # Read metadata
-            with open(extract_dir / "metadata.json", "r") as f:
-                metadata = json.load(f)
+            metadata = json.loads(members["metadata.json"])
+            version = metadata.get("version", "")
+            if not self._is_supported_version(version):
+                readable = ", ".join(f"{major}.x" for major in SUPPORTED_MODULE_MAJORS)
+                print(f"❌ Unsupported module format version {version!r} "
+                      f"(this loader reads {readable})")
+                return False
                 
             print(f"📦 Installing module: {metadata['name']}")
             print(f"📝 Description: {metadata['description']}")
@@ -105,30 +389,51 @@ class MatrixKnowledgeLoader:
             
             # Execute installation steps
             for step in manifest["install_steps"]:
-                await self._execute_install_step(step, extract_dir)
+                await self._execute_install_step(step, members)
                 
-            # Cleanup
-            import shutil
-            shutil.rmtree(extract_dir)
-            
             return True
             
         except Exception as e:
             print(f"❌ Installation error: {e}")
             return False
             
-    async def _execute_install_step(self, step: Dict, extract_dir: Path):
+    def _is_supported_version(self, version: str) -> bool:
+        """Check a module's version against the format this loader reads"""
+        major = str(version).split(".")[0]
+        return major.isdigit() and int(major) in SUPPORTED_MODULE_MAJORS
+        
+    def _read_members(self, module_path: Path) -> Dict[str, bytes]:
+        """Read all regular files of a module archive into memory in one pass"""
+        members = {}
+        with tarfile.open(module_path, "r|gz") as tar:
+            for member in tar:
+                if member.isfile():
+                    members[member.name] = tar.extractfile(member).read()
+        return members
+        
+    async def _execute_install_step(self, step: Dict, members: Dict[str, bytes]):
         """Execute a single installation step"""
         
         action = step["action"]
         
         if action == "load_embeddings":
             print("🧠 Loading knowledge embeddings...")
-            with open(extract_dir / step["file"], "rb") as f:
-                embeddings_data = pickle.load(f)
+            # Numeric columns are stored as separate out-of-band pickle buffers
+            buffers = [members[name] for name in step.get("buffers", [])]
+            embeddings_data = await asyncio.to_thread(
+                pickle.loads, members[step["file"]], buffers=buffers)
+            # 2.x modules are columnar; 1.x ones hold a list of chunk dicts
+            if not isinstance(embeddings_data, dict):
+                raise ValueError(f"unsupported embeddings format in {step['file']}")
+            if "ids" in embeddings_data:
+                chunk_count = len(embeddings_data["ids"])
+            elif "chunks" in embeddings_data:
+                chunk_count = len(embeddings_data["chunks"])
+            else:
+                raise ValueError(f"unsupported embeddings format in {step['file']}")
                 
             # In production, load into vector DB
-            print(f"  - Loaded {len(embeddings_data['chunks'])} knowledge chunks")
+            print(f"  - Loaded {chunk_count} knowledge chunks")
             
             if self.vector_db:
                 # await self.vector_db.bulk_import(embeddings_data)
@@ -142,12 +447,22 @@ class MatrixKnowledgeLoader:
             print("✓ Integrity verified")
             
     def _calculate_hash(self, file_path: Path) -> str:
-        """Calculate SHA256 hash of file"""
-        sha256_hash = hashlib.sha256()
+        """Calculate the module hash of a file"""
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+            try:
+                # Hash chunks as zero-copy slices of pages mapped by the kernel
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return _root_hash([
+                        hashlib.sha256(memoryview(mm)[i:i + MODULE_CHUNK_SIZE]).digest()
+                        for i in range(0, len(mm), MODULE_CHUNK_SIZE)
+                    ])
+            except (ValueError, OverflowError, OSError):
+                # Empty or unmappable file (or too large for the address space)
+                pass
+            hasher = ChunkHasher()
+            while data := f.read(MODULE_CHUNK_SIZE):
+                hasher.update(data)
+            return hasher.hexdigest()
         
     def list_installed_modules(self) -> Dict:
         """List all installed knowledge modules"""
@@ -8,16 +8,107 @@ import json
 import pickle
 import tarfile
 import hashlib
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import asyncio
 
+import numpy as np
+
+# Span covered by each chunk hash; the module hash is the SHA256 of the
+# concatenated chunk digests, so loaders can verify chunks in parallel
+VERIFY_CHUNK_SIZE = 8 << 20
+CHUNK_MANIFEST_SUFFIX = ".chunks.json"
+
+# Entity types that provide skills, and the prefix of the skill key each yields
+SKILL_PREFIXES = {
+    "Active_Project": "project_",
+    "Tool_Reference": "tool_",
+    "System_Protocol": "protocol_"
+}
+_SLUG_TABLE = str.maketrans(" ", "_")
+
+def _skill_slug(name: str) -> str:
+    """Lowercase a name and replace spaces with underscores for a skill key"""
+    return name.translate(_SLUG_TABLE).lower()
+
+
+class BufferReader:
+    """Minimal read-only file object over a bytes-like buffer, so large
+    payloads can be streamed into the archive without copying them first"""
+    
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+        
+    def __len__(self) -> int:
+        return len(self._view)
+        
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+
+class HashingWriter:
+    """File wrapper that SHA256-hashes everything written through it per
+    fixed-size chunk; the root over those chunk hashes is the module hash"""
+    
+    def __init__(self, fileobj, chunk_size: int = VERIFY_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.chunk_hashes = []
+        self._chunk_hash = hashlib.sha256()
+        self._chunk_filled = 0
+        
+    def write(self, data) -> int:
+        view = memoryview(data).cast("B")
+        while view:
+            take = min(len(view), self.chunk_size - self._chunk_filled)
+            self._chunk_hash.update(view[:take])
+            self._chunk_filled += take
+            view = view[take:]
+            if self._chunk_filled == self.chunk_size:
+                self._finish_chunk()
+        return self.fileobj.write(data)
+        
+    def flush(self):
+        self.fileobj.flush()
+        
+    def _finish_chunk(self):
+        self.chunk_hashes.append(self._chunk_hash.hexdigest())
+        self._chunk_hash = hashlib.sha256()
+        self._chunk_filled = 0
+        
+    def hexdigest(self) -> str:
+        """Root hash over the chunk hashes; call once writing is done"""
+        if self._chunk_filled:
+            self._finish_chunk()
+        root = b"".join(bytes.fromhex(h) for h in self.chunk_hashes)
+        return hashlib.sha256(root).hexdigest()
+        
+    def chunk_manifest(self) -> Dict:
+        """Module hash plus the chunk hashes it was derived from"""
+        return {
+            "root_hash": self.hexdigest(),
+            "chunk_size": self.chunk_size,
+            "chunk_hashes": self.chunk_hashes
+        }
+
+
 class KnowledgePackager:
     """Creates Matrix Knowledge Modules from various sources"""
     
-    def __init__(self):
-        self.module_version = "1.0.0"
+    def __init__(self, compress_level: int = 1, pretty_json: bool = False):
+        # 2.x: columnar embeddings with out-of-band numeric buffers
+        self.module_version = "2.0.0"
+        # gzip level for the .mkm archive; 1 packs far faster than 9, while
+        # decompression speed barely depends on the level
+        self.compress_level = compress_level
+        # Module JSON is machine-read, so write it compact unless debugging
+        self.pretty_json = pretty_json
         
     async def create_from_memory(self, 
                                 entities: List[Dict],
@@ -26,17 +117,18 @@ class KnowledgePackager:
         """Package memory entities into a knowledge module"""
         
         print(f"🎬 Creating knowledge module: {module_name}")
+        now = datetime.now(timezone.utc)
+        now_iso = now.isoformat()
         
-        # Create module directory
-        module_dir = Path(f"temp_{module_name}")
-        module_dir.mkdir(exist_ok=True)
+        # Module files are built in memory and streamed straight into the archive
+        members = {}
         
         # 1. Create metadata
         metadata = {
             "name": module_name,
             "description": description,
             "version": self.module_version,
-            "created": datetime.now().isoformat(),
+            "created": now_iso,
             "type": "memory_export",
             "entity_count": len(entities),
             "skills_provided": self._extract_skills(entities),
@@ -44,30 +136,36 @@ class KnowledgePackager:
             "size_estimate_mb": self._estimate_size(entities)
         }
         
-        with open(module_dir / "metadata.json", "w") as f:
-            json.dump(metadata, f, indent=2)
+        members["metadata.json"] = self._json_bytes(metadata)
             
         # 2. Process entities into embeddings format
         print("🧠 Processing memory entities...")
-        embeddings_data = self._create_embeddings_data(entities)
+        embeddings_data, source_names = self._create_embeddings_data(entities)
         
-        with open(module_dir / "embeddings.pkl", "wb") as f:
-            pickle.dump(embeddings_data, f)
+        # Protocol 5 hands numeric columns back out-of-band; each one is stored
+        # verbatim as its own archive member instead of being copied into the pickle
+        buffers = []
+        members["embeddings.pkl"] = pickle.dumps(embeddings_data, protocol=5,
+                                                 buffer_callback=buffers.append)
+        buffer_names = []
+        for i, buffer in enumerate(buffers):
+            buffer_names.append(f"embeddings.buf.{i}")
+            members[buffer_names[-1]] = buffer.raw()
             
         # 3. Create sources manifest
         sources = {
-            "memory_entities": [e.get("name", "unknown") for e in entities],
-            "export_timestamp": datetime.now().isoformat(),
-            "total_observations": sum(len(e.get("observations", [])) for e in entities)
+            "memory_entities": source_names,
+            "export_timestamp": now_iso,
+            "total_observations": len(embeddings_data["ids"])
         }
         
-        with open(module_dir / "sources.json", "w") as f:
-            json.dump(sources, f, indent=2)
+        members["sources.json"] = self._json_bytes(sources)
             
         # 4. Create installation manifest
         manifest = {
             "install_steps": [
-                {"action": "load_embeddings", "file": "embeddings.pkl"},
+                {"action": "load_embeddings", "file": "embeddings.pkl",
+                 "buffers": buffer_names},
                 {"action": "register_metadata", "file": "metadata.json"},
                 {"action": "verify_integrity", "check": "hash"}
             ],
@@ -77,92 +175,98 @@ class KnowledgePackager:
             }
         }
         
-        with open(module_dir / "manifest.json", "w") as f:
-            json.dump(manifest, f, indent=2)
+        members["manifest.json"] = self._json_bytes(manifest)
             
         # 5. Create the .mkm archive
         print("📦 Packaging module...")
         mkm_path = Path(f"{module_name}.mkm")
         
-        with tarfile.open(mkm_path, "w:gz") as tar:
-            for file in module_dir.iterdir():
-                tar.add(file, arcname=file.name)
-                
-        # 6. Calculate hash
-        module_hash = self._calculate_hash(mkm_path)
+        # Hash the archive bytes as they are written instead of re-reading it
+        with open(mkm_path, "wb") as raw:
+            writer = HashingWriter(raw)
+            with tarfile.open(mkm_path, "w:gz", fileobj=writer,
+                              compresslevel=self.compress_level) as tar:
+                for name, data in members.items():
+                    self._add_member(tar, name, data, now.timestamp())
+                    
+        # 6. Module hash, plus the chunk hashes it is built from so loaders can
+        # verify in parallel. These live beside the archive, not inside it
+        module_hash = writer.hexdigest()
+        chunk_manifest_path = mkm_path.with_name(mkm_path.name + CHUNK_MANIFEST_SUFFIX)
+        chunk_manifest_path.write_bytes(self._json_bytes(writer.chunk_manifest()))
         print(f"✅ Module created: {mkm_path} (hash: {module_hash[:16]}...)")
         
-        # Cleanup
-        import shutil
-        shutil.rmtree(module_dir)
-        
         return mkm_path
         
-    def _extract_skills(self, entities: List[Dict]) -> List[str]:
-        """Extract skills/capabilities from entities"""
-        skills = set()
+    def _json_bytes(self, obj: Any) -> bytes:
+        """Serialize JSON compactly, or indented when pretty_json is set"""
+        if self.pretty_json:
+            return json.dumps(obj, indent=2).encode()
+        return json.dumps(obj, separators=(",", ":")).encode()
         
-        for entity in entities:
-            entity_type = entity.get("entityType", "")
-            name = entity.get("name", "")
+    def _add_member(self, tar: tarfile.TarFile, name: str, data, mtime: float):
+        """Add an in-memory file (any bytes-like object) to the archive"""
+        reader = BufferReader(data)
+        info = tarfile.TarInfo(name)
+        info.size = len(reader)
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        tar.addfile(info, reader)
             
-            if entity_type == "Active_Project":
-                skills.add(f"project_{name.lower().replace(' ', '_')}")
-            elif entity_type == "Tool_Reference":
-                skills.add(f"tool_{name.lower()}")
-            elif entity_type == "System_Protocol":
-                skills.add(f"protocol_{name.lower().replace(' ', '_')}")
-                
+    def _extract_skills(self, entities: List[Dict]) -> List[str]:
+        """Extract skills/capabilities from entities"""
+        skills = {
+            SKILL_PREFIXES[entity_type] + _skill_slug(entity.get("name", ""))
+            for entity in entities
+            if (entity_type := entity.get("entityType", "")) in SKILL_PREFIXES
+        }
         return list(skills)
         
     def _estimate_size(self, entities: List[Dict]) -> float:
         """Estimate compressed size in MB"""
-        total_chars = sum(len(str(e)) for e in entities)
+        # Count the text payload directly rather than repr-ing every entity
+        total_chars = sum(
+            len(e.get("name", "")) + sum(len(obs) for obs in e.get("observations", []))
+            for e in entities
+        )
         # Rough estimate: 10:1 compression ratio
         return round(total_chars / (1024 * 1024 * 10), 2)
         
-    def _create_embeddings_data(self, entities: List[Dict]) -> Dict:
-        """Convert entities to embeddings-ready format"""
-        embeddings_data = {
-            "chunks": [],
-            "metadata": [],
-            "entity_map": {}
-        }
+    def _create_embeddings_data(self, entities: List[Dict]) -> Tuple[Dict, List[str]]:
+        """Convert entities to embeddings-ready format (one column per field).
+        Returns the columns and the entity names, gathered in the same pass"""
+        source_names = []
+        ids = []
+        texts = []
+        entity_names = []
+        entity_types = []
+        char_counts = array("I")
+        entity_map = {}
         
-        chunk_id = 0
         for entity in entities:
             entity_name = entity.get("name", "unknown")
             entity_type = entity.get("entityType", "unknown")
+            source_names.append(entity_name)
             
             # Each observation becomes a chunk
             for obs in entity.get("observations", []):
-                embeddings_data["chunks"].append({
-                    "id": chunk_id,
-                    "text": obs,
-                    "entity": entity_name,
-                    "type": entity_type
-                })
-                
-                embeddings_data["metadata"].append({
-                    "chunk_id": chunk_id,
-                    "entity_name": entity_name,
-                    "entity_type": entity_type,
-                    "char_count": len(obs)
-                })
-                
-                chunk_id += 1
+                ids.append(len(ids))
+                texts.append(obs)
+                entity_names.append(entity_name)
+                entity_types.append(entity_type)
+                char_counts.append(len(obs))
                 
-            embeddings_data["entity_map"][entity_name] = entity_type
+            entity_map[entity_name] = entity_type
             
-        return embeddings_data
-        
-    def _calculate_hash(self, file_path: Path) -> str:
-        """Calculate SHA256 hash of file"""
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        return {
+            "ids": ids,
+            "texts": texts,
+            "entity_names": entity_names,
+            "entity_types": entity_types,
+            # numpy view of the counts, so pickle can emit it as an out-of-band buffer
+            "char_counts": np.asarray(char_counts, dtype=np.uint32),
+            "entity_map": entity_map
+        }, source_names
 
 
 # Example usage
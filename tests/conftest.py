@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# loader/ and packager/ are standalone scripts rather than packages
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "loader"), str(ROOT / "packager")]
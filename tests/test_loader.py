@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import tarfile
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from create_module import HashingWriter, KnowledgePackager
+from download import (
+    CHUNK_MANIFEST_SUFFIX,
+    MODULE_CHUNK_SIZE,
+    ChunkHasher,
+    HashCache,
+    MatrixKnowledgeLoader,
+)
+
+SAMPLE_ENTITIES = [
+    {
+        "name": "Matrix_Knowledge_System",
+        "entityType": "Active_Project",
+        "observations": ["Trinity-style downloadable knowledge modules"]
+    }
+]
+
+
+@pytest.fixture
+def loader(tmp_path):
+    hash_cache = HashCache(tmp_path / "hashes.sqlite")
+    yield MatrixKnowledgeLoader(hash_cache=hash_cache)
+    hash_cache.close()
+
+
+@pytest.fixture
+def module_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    packager = KnowledgePackager()
+    return asyncio.run(
+        packager.create_from_memory(SAMPLE_ENTITIES, "sample", "Sample module"))
+
+
+def _sidecar(module_path):
+    return module_path.with_name(module_path.name + CHUNK_MANIFEST_SUFFIX)
+
+
+def test_module_hash_same_with_and_without_sidecar(loader, module_path):
+    root_hash = json.loads(_sidecar(module_path).read_text())["root_hash"]
+
+    assert loader._verify_module(module_path)
+    assert loader.hash_cache.get(module_path) == root_hash
+    assert loader._calculate_hash(module_path) == root_hash
+
+
+def test_module_hash_agrees_across_hashers(tmp_path, loader):
+    data = os.urandom(MODULE_CHUNK_SIZE * 2 + 12345)
+    file_path = tmp_path / "data.mkm"
+    file_path.write_bytes(data)
+
+    # Feed both incremental hashers in pieces that straddle chunk boundaries
+    writer = HashingWriter(io.BytesIO())
+    hasher = ChunkHasher()
+    for i in range(0, len(data), 3_000_001):
+        writer.write(data[i:i + 3_000_001])
+        hasher.update(data[i:i + 3_000_001])
+
+    assert len(writer.chunk_manifest()["chunk_hashes"]) == 3
+    assert writer.hexdigest() == hasher.hexdigest() == loader._calculate_hash(file_path)
+
+
+def test_tampered_module_with_rewritten_chunk_hashes(loader, module_path):
+    sidecar = _sidecar(module_path)
+    chunk_manifest = json.loads(sidecar.read_text())
+    root_hash = chunk_manifest["root_hash"]
+
+    # Flip a byte and make the chunk hashes match it, keeping the old root
+    data = bytearray(module_path.read_bytes())
+    data[-1] ^= 0xFF
+    module_path.write_bytes(data)
+    chunk_manifest["chunk_hashes"] = [hashlib.sha256(data).hexdigest()]
+    sidecar.write_text(json.dumps(chunk_manifest))
+
+    # The sidecar no longer adds up, so the file itself is rehashed
+    assert loader._verify_module(module_path)
+    assert loader.hash_cache.get(module_path) != root_hash
+    assert loader.hash_cache.get(module_path) == loader._calculate_hash(module_path)
+
+
+def test_tampered_module_fails_chunk_check(loader, module_path):
+    data = bytearray(module_path.read_bytes())
+    data[-1] ^= 0xFF
+    module_path.write_bytes(data)
+
+    assert not loader._verify_module(module_path)
+    assert loader.hash_cache.get(module_path) is None
+
+
+def test_malformed_sidecar_is_ignored(loader, module_path):
+    sidecar = _sidecar(module_path)
+    chunk_manifest = json.loads(sidecar.read_text())
+
+    for bad in ({**chunk_manifest, "chunk_size": 1024},
+                {**chunk_manifest, "chunk_hashes": ["zz" * 32]},
+                {**chunk_manifest, "chunk_hashes": "not a list"},
+                ["not", "a", "dict"]):
+        sidecar.write_text(json.dumps(bad))
+        assert loader._load_chunk_manifest(module_path) is None
+
+    sidecar.write_text("{truncated")
+    assert loader._load_chunk_manifest(module_path) is None
+
+
+def test_download_skills_deduplicates_names(loader, monkeypatch):
+    calls = []
+
+    async def fake_download_skill(skill_name, source_url=None):
+        calls.append(skill_name)
+        return True
+
+    monkeypatch.setattr(loader, "download_skill", fake_download_skill)
+    results = asyncio.run(loader.download_skills(["a", "b", "a"]))
+
+    assert calls == ["a", "b"]
+    assert results == {"a": True, "b": True}
+
+
+@pytest_asyncio.fixture
+async def module_server(module_path):
+    """Serves the sample module whole at /good and cut off midway at /cut"""
+    data = module_path.read_bytes()
+
+    async def good(request):
+        return web.Response(body=data)
+
+    async def cut(request):
+        response = web.StreamResponse(headers={"Content-Length": str(len(data))})
+        await response.prepare(request)
+        await response.write(data[:len(data) // 2])
+        request.transport.close()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/good", good)
+    app.router.add_get("/cut", cut)
+    async with TestServer(app) as server:
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_download_hashes_while_streaming(loader, module_server):
+    module_path, known_hash = await loader._download_from_url(
+        str(module_server.make_url("/good")), "sample")
+
+    assert known_hash == loader._calculate_hash(module_path)
+    assert not module_path.with_suffix(".mkm.part").exists()
+
+
+@pytest.mark.asyncio
+async def test_failed_download_keeps_existing_module(loader, module_path,
+                                                     module_server):
+    original = module_path.read_bytes()
+    url = str(module_server.make_url("/cut"))
+
+    assert not await loader.download_skill("sample", url)
+    assert module_path.read_bytes() == original
+    assert not module_path.with_suffix(".mkm.part").exists()
+
+
+@pytest.mark.asyncio
+async def test_download_disk_error_reports_failure(loader, module_path,
+                                                   module_server, monkeypatch):
+    def fail_replace(src, dst):
+        raise PermissionError(dst)
+
+    monkeypatch.setattr(os, "replace", fail_replace)
+    url = str(module_server.make_url("/good"))
+
+    assert not await loader.download_skill("sample", url)
+    assert not module_path.with_suffix(".mkm.part").exists()
+
+
+def _write_module(module_path, version, embeddings_data):
+    """Write a minimal module archive in the given format version"""
+    members = {
+        "metadata.json": json.dumps({"name": module_path.stem, "description": "",
+                                     "version": version, "skills_provided": []}),
+        "manifest.json": json.dumps({"install_steps": [
+            {"action": "load_embeddings", "file": "embeddings.pkl"}]}),
+        "embeddings.pkl": pickle.dumps(embeddings_data),
+    }
+    with tarfile.open(module_path, "w:gz") as tar:
+        for name, data in members.items():
+            data = data.encode() if isinstance(data, str) else data
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_installs_1x_module(tmp_path, loader, capsys):
+    module_path = tmp_path / "legacy.mkm"
+    _write_module(module_path, "1.0.0",
+                  {"chunks": [{"id": 0, "text": "a"}, {"id": 1, "text": "b"}],
+                   "entity_map": {}})
+
+    assert asyncio.run(loader._install_module(module_path))
+    assert "Loaded 2 knowledge chunks" in capsys.readouterr().out
+
+
+def test_rejects_unknown_major_version(tmp_path, loader):
+    module_path = tmp_path / "future.mkm"
+    _write_module(module_path, "3.0.0", {"ids": []})
+
+    assert not asyncio.run(loader._install_module(module_path))
+
+
+def test_hash_cache_tracks_file_changes(tmp_path, monkeypatch):
+    connects = []
+    real_connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, "connect",
+                        lambda *args, **kwargs: connects.append(args)
+                        or real_connect(*args, **kwargs))
+    hash_cache = HashCache(tmp_path / "cache" / "hashes.sqlite")
+    file_path = tmp_path / "module.mkm"
+    file_path.write_bytes(b"first")
+
+    assert hash_cache.get(file_path) is None
+    hash_cache.put(file_path, "a" * 64)
+    assert hash_cache.get(file_path) == "a" * 64
+
+    # A rewritten file no longer matches, and its new hash replaces the old row
+    file_path.write_bytes(b"second version")
+    assert hash_cache.get(file_path) is None
+    hash_cache.put(file_path, "b" * 64)
+    assert hash_cache.get(file_path) == "b" * 64
+    rows = hash_cache._connection().execute("SELECT COUNT(*) FROM hashes").fetchone()
+    assert rows == (1,)
+
+    assert len(connects) == 1
+    hash_cache.close()
+
+
+def test_known_hash_skips_cache_lookup(loader, module_path, monkeypatch):
+    lookups = []
+    real_get = loader.hash_cache.get
+    monkeypatch.setattr(loader.hash_cache, "get", lookups.append)
+
+    assert loader._verify_module(module_path, known_hash="c" * 64)
+    assert lookups == []
+    assert real_get(module_path) == "c" * 64